@@ -0,0 +1,186 @@
+"""
+Audio buffer helpers for the voice bot
+Parses and writes WAV headers in place, converts browser recordings to the
+16 kHz mono 16-bit PCM the recognizer expects, and decodes MP3/Opus in-process
+"""
+
+import io
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+RECOGNIZER_SAMPLE_RATE = 16000
+WAV_HEADER_SIZE = 44
+
+WavInfo = namedtuple("WavInfo", "sample_rate channels sample_width audio_format data_offset data_size")
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def sniff_format(data):
+    """Guess the container of an audio buffer from its magic bytes"""
+    head = bytes(memoryview(data)[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"\x1aE\xdf\xa3":
+        return "webm"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def parse_wav_header(data):
+    """Walk the RIFF chunks of a WAV buffer without copying it"""
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE buffer")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        (chunk_size,) = struct.unpack_from("<I", view, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body + 16 > len(view):
+                raise ValueError("Truncated WAV fmt chunk")
+            fmt = struct.unpack_from("<HHIIHH", view, body)
+            if fmt[0] == _WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                if body + 26 > len(view):
+                    raise ValueError("Truncated WAV fmt chunk")
+                # The real format code is the first two bytes of the sub-format GUID
+                (sub_format,) = struct.unpack_from("<H", view, body + 24)
+                fmt = (sub_format,) + fmt[1:]
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            # Browsers streaming WAV often leave the size as 0 or 0xFFFFFFFF
+            data_size = min(chunk_size, len(view) - body) if chunk_size else len(view) - body
+            audio_format, channels, sample_rate, _, _, bits = fmt
+            if not channels or not sample_rate or bits < 8:
+                raise ValueError("Invalid WAV fmt chunk")
+            return WavInfo(sample_rate, channels, bits // 8, audio_format, body, data_size)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV buffer has no data chunk")
+
+
+def wav_samples(data):
+    """Return (samples, info) where samples is a NumPy view over the WAV payload"""
+    info = parse_wav_header(data)
+    dtypes = {
+        (_WAVE_FORMAT_PCM, 1): np.uint8,
+        (_WAVE_FORMAT_PCM, 2): np.dtype("<i2"),
+        (_WAVE_FORMAT_PCM, 4): np.dtype("<i4"),
+        (_WAVE_FORMAT_FLOAT, 4): np.dtype("<f4"),
+    }
+    dtype = dtypes.get((info.audio_format, info.sample_width))
+    if dtype is None:
+        raise ValueError(f"Unsupported WAV encoding: format {info.audio_format}, {info.sample_width * 8} bit")
+    count = info.data_size // (info.sample_width * info.channels) * info.channels
+    samples = np.frombuffer(data, dtype=dtype, count=count, offset=info.data_offset)
+    return samples, info
+
+
+def to_int16(samples):
+    """Rescale samples of any supported WAV dtype to int16 (no copy if already int16)"""
+    if samples.dtype == np.int16:
+        return samples
+    if samples.dtype == np.uint8:
+        return ((samples.astype(np.int16) - 128) << 8).astype(np.int16)
+    if samples.dtype.kind == "f":
+        return np.clip(samples * 32767.0, -32768, 32767).astype(np.int16)
+    return (samples >> (8 * samples.dtype.itemsize - 16)).astype(np.int16)
+
+
+def to_mono(samples, channels):
+    """Downmix interleaved samples to mono (no copy for mono input)"""
+    if channels == 1:
+        return samples
+    frames = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    return frames.mean(axis=1, dtype=np.float32)
+
+
+def resample(samples, source_rate, target_rate=RECOGNIZER_SAMPLE_RATE):
+    """Vectorized resampling of mono samples; returns float32 or the input when rates match"""
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if source_rate % target_rate == 0:
+        # Integer decimation (48k/32k -> 16k): average each block, which also low-passes
+        factor = source_rate // target_rate
+        usable = len(samples) - len(samples) % factor
+        return samples[:usable].reshape(-1, factor).mean(axis=1, dtype=np.float32)
+    duration = len(samples) / source_rate
+    target_times = np.arange(int(duration * target_rate), dtype=np.float64) / target_rate
+    source_times = np.arange(len(samples), dtype=np.float64) / source_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def write_wav_header(buffer, sample_rate, channels=1, sample_width=2, data_size=0, offset=0):
+    """Write a canonical 44-byte PCM WAV header into `buffer` in place"""
+    byte_rate = sample_rate * channels * sample_width
+    struct.pack_into(
+        "<4sI4s4sIHHIIHH4sI", buffer, offset,
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, _WAVE_FORMAT_PCM, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b"data", data_size,
+    )
+    return buffer
+
+
+def pcm_to_wav(pcm, sample_rate=RECOGNIZER_SAMPLE_RATE, channels=1):
+    """Wrap 16-bit PCM in a WAV container with a single allocation"""
+    pcm = memoryview(pcm).cast("B")
+    out = bytearray(WAV_HEADER_SIZE + len(pcm))
+    write_wav_header(out, sample_rate, channels, 2, len(pcm))
+    out[WAV_HEADER_SIZE:] = pcm
+    return out
+
+
+def decode_compressed(data, target_rate=RECOGNIZER_SAMPLE_RATE):
+    """Decode MP3/Ogg-Opus/WebM to mono int16 PCM at `target_rate` using PyAV"""
+    # Imported on first use: PyAV loads FFmpeg, which would dominate cold start
+    try:
+        import av
+    except ImportError:
+        raise ValueError("Compressed audio needs PyAV (pip install av)")
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=target_rate)
+    chunks = []
+    with av.open(io.BytesIO(data), mode="r") as container:
+        for frame in container.decode(audio=0):
+            for out_frame in resampler.resample(frame):
+                chunks.append(out_frame.to_ndarray().reshape(-1))
+        for out_frame in resampler.resample(None):
+            chunks.append(out_frame.to_ndarray().reshape(-1))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+
+
+def to_recognizer_samples(data):
+    """Convert a WAV/MP3/Opus buffer to 16 kHz mono int16 samples.
+
+    Input that is already 16 kHz mono 16-bit PCM is returned as a view over
+    the original buffer; everything else is converted with one vectorized pass.
+    """
+    kind = sniff_format(data)
+    if kind in ("mp3", "ogg", "webm"):
+        return decode_compressed(data)
+    if kind != "wav":
+        raise ValueError("Unrecognized audio format")
+    samples, info = wav_samples(data)
+    mono = resample(to_mono(to_int16(samples), info.channels), info.sample_rate)
+    if mono.dtype == np.int16:
+        return mono
+    return np.clip(np.rint(mono), -32768, 32767).astype(np.int16)
+
+
+def frame_rms(samples, frame_len):
+    """Per-frame RMS energy of mono samples, computed in one vectorized pass"""
+    usable = len(samples) - len(samples) % frame_len
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:usable].reshape(-1, frame_len).astype(np.float32)
+    return np.sqrt(np.mean(frames * frames, axis=1))
@@ -0,0 +1,172 @@
+"""
+Durable conversation log for the voice bot
+Append-only segment files with a per-session index. Writes are batched on a
+background thread; resume memory-maps the segments and reads only the last turns.
+"""
+
+import atexit
+import json
+import mmap
+import os
+import queue
+import threading
+from collections import defaultdict
+
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+FLUSH_INTERVAL_S = 0.5
+
+
+class ConversationLog:
+    """Append-only, segment-file conversation log indexed by session ID"""
+
+    def __init__(self, root_dir, segment_max_bytes=SEGMENT_MAX_BYTES, flush_interval=FLUSH_INTERVAL_S):
+        self.root_dir = root_dir
+        self.segment_dir = os.path.join(root_dir, "segments")
+        self.audio_dir = os.path.join(root_dir, "audio")
+        self.index_path = os.path.join(root_dir, "index.log")
+        self.segment_max_bytes = segment_max_bytes
+        self.flush_interval = flush_interval
+        os.makedirs(self.segment_dir, exist_ok=True)
+        os.makedirs(self.audio_dir, exist_ok=True)
+
+        self._index = defaultdict(list)  # session_id -> [(segment, offset, length)]
+        self._index_lock = threading.Lock()
+        self._load_index()
+        self._segment = self._latest_segment()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-log", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def append(self, session_id, turn):
+        """Queue a turn for writing; never blocks the caller on disk I/O"""
+        self._queue.put((session_id, turn))
+
+    def load_recent(self, session_id, limit):
+        """Return the last `limit` turns of a session, oldest first; unreadable records are skipped"""
+        with self._index_lock:
+            entries = list(self._index.get(session_id, [])[-limit:])
+
+        turns = []
+        maps = {}
+        try:
+            for segment, offset, length in entries:
+                if segment not in maps:
+                    try:
+                        with open(self._segment_path(segment), "rb") as f:
+                            maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError):
+                        maps[segment] = None  # missing or empty segment
+                mapped = maps[segment]
+                if mapped is None or offset + length > len(mapped):
+                    continue
+                try:
+                    turn = json.loads(mapped[offset:offset + length])
+                except ValueError:
+                    continue  # corrupt record (JSONDecodeError and bad UTF-8 are both ValueErrors)
+                if isinstance(turn, dict):
+                    turns.append(turn)
+        finally:
+            for mapped in maps.values():
+                if mapped is not None:
+                    mapped.close()
+        return turns
+
+    def load_audio(self, audio_ref):
+        """Read an externally stored audio clip, or None if it is gone"""
+        try:
+            with open(os.path.join(self.root_dir, audio_ref), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def close(self):
+        """Flush queued turns and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.segment_dir, f"segment-{segment:06d}.log")
+
+    def _latest_segment(self):
+        """Number of the segment new records are appended to"""
+        segments = [int(name[8:14]) for name in os.listdir(self.segment_dir)
+                    if name.startswith("segment-") and name.endswith(".log")]
+        return max(segments, default=1)
+
+    def _load_index(self):
+        """Rebuild the in-memory session index from the append-only index file"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        continue  # torn write from a crash
+                    session_id, segment, offset, length = parts
+                    try:
+                        entry = (int(segment), int(offset), int(length))
+                    except ValueError:
+                        continue  # garbled line
+                    self._index[session_id].append(entry)
+        except FileNotFoundError:
+            pass
+
+    def _write_loop(self):
+        """Writer thread: batch queued turns and flush them every `flush_interval` seconds"""
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                while True:
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError:
+                    # Losing a batch must never take the app down; the session still has it in memory
+                    pass
+
+    def _write_batch(self, batch):
+        """Append a batch to the current segment, then publish it in the index"""
+        path = self._segment_path(self._segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+            self._segment += 1
+            path = self._segment_path(self._segment)
+
+        index_lines = []
+        with open(path, "ab") as segment_file:
+            offset = segment_file.tell()
+            for session_id, turn in batch:
+                record = json.dumps(self._externalize_audio(turn), ensure_ascii=False).encode("utf-8")
+                segment_file.write(record + b"\n")
+                index_lines.append((session_id, self._segment, offset, len(record)))
+                offset += len(record) + 1
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+
+        # Index after the data is durable, so an index entry always points at a full record
+        with open(self.index_path, "a", encoding="utf-8") as index_file:
+            index_file.writelines(f"{sid}\t{seg}\t{off}\t{length}\n" for sid, seg, off, length in index_lines)
+        with self._index_lock:
+            for session_id, segment, offset, length in index_lines:
+                self._index[session_id].append((segment, offset, length))
+
+    def _externalize_audio(self, turn):
+        """Move audio bytes to their own file and keep only a reference in the record"""
+        record = {key: value for key, value in turn.items() if key != "audio"}
+        audio = turn.get("audio")
+        if audio:
+            audio_ref = os.path.join("audio", f"{turn['id']}.audio")
+            with open(os.path.join(self.root_dir, audio_ref), "wb") as f:
+                f.write(audio)
+            record["audio_ref"] = audio_ref
+        return record
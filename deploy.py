@@ -49,6 +49,49 @@ def check_prerequisites():
     
     return True
 
+# Modules that must only be imported lazily, on first use
+LAZY_MODULES = ['azure.cognitiveservices.speech', 'openai', 'gtts', 'audio_recorder_streamlit', 'requests', 'av']
+
+# Modules the app imports at startup on purpose; their import time counts against the
+# app's own STARTUP_IMPORT_BUDGET_S, which the probe reads so the budget is defined once
+EAGER_MODULES = ['numpy']
+
+def check_startup_budget():
+    """Import the app in a fresh interpreter and check its cold-start time and lazy imports"""
+    print("⏱️  Checking startup import budget...")
+    probe = (
+        "import importlib, json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "expected = {}\n"
+        f"for name in {EAGER_MODULES!r}:\n"
+        "    module_started = time.perf_counter()\n"
+        "    importlib.import_module(name)\n"
+        "    expected[name] = time.perf_counter() - module_started\n"
+        "import streamlit_app\n"
+        "elapsed = time.perf_counter() - started\n"
+        f"eager = [m for m in {LAZY_MODULES!r} if m in sys.modules]\n"
+        "budget = streamlit_app.STARTUP_IMPORT_BUDGET_S\n"
+        "print(json.dumps({'elapsed': elapsed, 'eager': eager, 'expected': expected, 'budget': budget}))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, cwd=Path(__file__).parent)
+    if result.returncode != 0:
+        print(f"❌ Could not import streamlit_app: {result.stderr.strip()}")
+        return False
+    
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    ok = True
+    if report['eager']:
+        print(f"❌ Heavy modules imported at startup: {', '.join(report['eager'])}")
+        ok = False
+    if report['elapsed'] > report['budget']:
+        print(f"❌ Startup import took {report['elapsed']:.2f}s (budget {report['budget']:.2f}s)")
+        ok = False
+    if ok:
+        print(f"✅ Startup import took {report['elapsed']:.2f}s (budget {report['budget']:.2f}s)")
+    for name, seconds in report['expected'].items():
+        print(f"   includes {name}: {seconds:.2f}s")
+    return ok
+
 def setup_git():
     """Initialize git repository if not already done"""
     if not Path('.git').exists():
@@ -175,6 +218,10 @@ def main():
     if not check_prerequisites():
         sys.exit(1)
     
+    # Guard against cold-start regressions before deploying
+    if not check_startup_budget():
+        sys.exit(1)
+    
     # Setup Git
     setup_git()
     
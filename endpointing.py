@@ -0,0 +1,172 @@
+"""
+Adaptive endpointing for the voice bot
+Learns the speaker's pause distribution over the session and picks the
+recognizer's silence timeouts per turn instead of fixed values
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from audio_buffer import frame_rms
+
+logger = logging.getLogger(__name__)
+
+# The timeouts each recognition path used before endpointing was adaptive.
+# They remain the behaviour in "fixed" mode and the prior until enough pauses are seen.
+FIXED_TIMEOUTS = {
+    "continuous": {"initial_ms": 3000, "end_ms": 1000, "segmentation_ms": 1000},
+    "direct": {"initial_ms": 5000, "end_ms": 3000, "segmentation_ms": None},
+    "recorded": {"initial_ms": 5000, "end_ms": 2000, "segmentation_ms": 2000},
+}
+
+DEFAULT_ENDPOINTING_CONFIG = {
+    "mode": "adaptive",        # "adaptive" or "fixed"
+    "min_ms": 300,             # never end a turn faster than this
+    "max_ms": 3000,            # never wait longer than this
+    "percentile": 0.9,         # pause percentile treated as "still talking"
+    "margin_ms": 150,          # safety margin added on top of the percentile
+    "min_samples": 5,          # pauses needed before leaving the fixed prior
+    "window": 200,             # pauses remembered per session
+    "min_pause_ms": 120,       # shorter gaps are ordinary word boundaries
+    "vad_frame_ms": 20,        # local VAD frame length
+    "vad_ratio": 3.0,          # speech threshold as a multiple of the noise floor
+    "truncation_window_ms": 1500,  # speech resuming this soon after a turn ended means we cut it off
+}
+
+
+class AdaptiveEndpointer:
+    """Per-session endpointing state: pause history, partial stability and decisions"""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_ENDPOINTING_CONFIG)
+        self.config.update(config or {})
+        self.pauses = deque(maxlen=int(self.config["window"]))
+        self.decisions = deque(maxlen=50)
+        self.partials = 0
+        self.revisions = 0
+        self.utterances = 0
+        self.truncations = 0
+        self._lock = threading.Lock()
+        self._last_partial = ""
+        self._last_partial_at = None
+        self._ended_at = None
+
+    def start_utterance(self):
+        """Reset partial tracking before listening (re)starts on a fresh recognition"""
+        with self._lock:
+            self._last_partial = ""
+            self._last_partial_at = None
+            # Speech after a restart says nothing about the previous turn's timeout
+            self._ended_at = None
+
+    def end_utterance(self, mic_live=False):
+        """Note that a recognition returned a final result.
+
+        Pass `mic_live=True` when the microphone keeps listening (continuous recognition):
+        only then can the next utterance show that the previous turn was cut off.
+        """
+        with self._lock:
+            self.utterances += 1
+            self._last_partial = ""
+            self._last_partial_at = None
+            self._ended_at = time.time() if mic_live else None
+
+    def _check_truncation(self, now):
+        """On the first partial after a live-mic final result: did the speaker resume right away?
+
+        Pauses long enough to end a turn are never seen by observe_partial, so the
+        learned distribution is biased short. Speech resuming within the window means
+        the timeout cut the speaker off; the truncation rate widens later timeouts.
+        """
+        if self._ended_at is None:
+            return
+        resumed_ms = (now - self._ended_at) * 1000
+        self._ended_at = None
+        if resumed_ms <= self.config["truncation_window_ms"]:
+            self.truncations += 1
+
+    def observe_partial(self, text):
+        """Learn from a `recognizing` event: inter-word pauses and hypothesis rewrites"""
+        now = time.time()
+        text = (text or "").strip().lower()
+        if not text:
+            return
+        with self._lock:
+            if self._last_partial_at is None:
+                self._check_truncation(now)
+            else:
+                gap_ms = (now - self._last_partial_at) * 1000
+                if gap_ms >= self.config["min_pause_ms"]:
+                    self.pauses.append(gap_ms)
+            # A hypothesis that does not extend the previous one was revised by the recognizer
+            if self._last_partial and not text.startswith(self._last_partial):
+                self.revisions += 1
+            self.partials += 1
+            self._last_partial = text
+            self._last_partial_at = now
+
+    def observe_audio(self, samples, sample_rate):
+        """Run local VAD over mono PCM samples and learn the speaker's pauses from them"""
+        frame_ms = self.config["vad_frame_ms"]
+        energies = frame_rms(samples, max(1, int(sample_rate * frame_ms / 1000)))
+        if not len(energies):
+            return
+
+        noise_floor = max(float(np.percentile(energies, 10)), 50.0)
+        voiced = np.flatnonzero(energies >= noise_floor * self.config["vad_ratio"])
+        if not len(voiced):
+            return
+
+        # Unvoiced runs between voiced frames are the speaker's pauses
+        gaps_ms = (np.diff(voiced) - 1) * frame_ms
+        pauses = gaps_ms[gaps_ms >= self.config["min_pause_ms"]]
+        with self._lock:
+            self.pauses.extend(float(pause) for pause in pauses)
+
+    def choose_timeouts(self, context):
+        """Pick silence timeouts for the next recognition in `context` and log the choice"""
+        fixed = FIXED_TIMEOUTS[context]
+        timeouts = dict(fixed)
+        with self._lock:
+            samples = sorted(self.pauses)
+            revision_rate = self.revisions / self.partials if self.partials else 0.0
+            truncation_rate = self.truncations / self.utterances if self.utterances else 0.0
+
+        if self.config["mode"] != "adaptive":
+            reason = "fixed"
+        elif context == "recorded":
+            # The whole clip is pushed before recognition starts, so a shorter end-of-silence
+            # saves nothing and a shorter segmentation timeout only cuts the transcript short
+            reason = "fixed (recorded clip)"
+        elif len(samples) < self.config["min_samples"]:
+            reason = f"prior ({len(samples)}/{self.config['min_samples']} pauses)"
+        else:
+            index = min(len(samples) - 1, int(self.config["percentile"] * len(samples)))
+            end_ms = samples[index] + self.config["margin_ms"]
+            # Unstable partials mean the recognizer is still revising, and cut-off turns mean
+            # we ended too early; both give the speaker more time
+            end_ms *= 1.0 + revision_rate + truncation_rate
+            end_ms = int(min(self.config["max_ms"], max(self.config["min_ms"], end_ms)))
+            timeouts["end_ms"] = end_ms
+            if fixed["segmentation_ms"] is not None:
+                timeouts["segmentation_ms"] = end_ms
+            reason = (f"p{int(self.config['percentile'] * 100)} of {len(samples)} pauses, "
+                      f"revisions {revision_rate:.0%}, truncations {truncation_rate:.0%}")
+
+        decision = {
+            "context": context,
+            "end_ms": timeouts["end_ms"],
+            "segmentation_ms": timeouts["segmentation_ms"],
+            "saved_ms": fixed["end_ms"] - timeouts["end_ms"],
+            "reason": reason,
+            "timestamp": time.time(),
+        }
+        self.decisions.append(decision)
+        segmentation = timeouts["segmentation_ms"]
+        logger.info("Endpointing [%s]: end=%dms segmentation=%s (%s)", context, timeouts["end_ms"],
+                    f"{segmentation}ms" if segmentation is not None else "default", reason)
+        return timeouts
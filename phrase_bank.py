@@ -0,0 +1,141 @@
+"""
+Pre-synthesized phrase bank for the voice bot
+Acknowledgements, error messages and FAQ answers are synthesized once
+in the background, persisted on disk and then served with no synthesis cost
+"""
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# A phrase whose synthesis failed is retried after this delay, doubling per failure up to the cap
+RETRY_BACKOFF_S = 30
+MAX_RETRY_BACKOFF_S = 600
+
+DEFAULT_PHRASES = {
+    "acknowledgement": [
+        "Got it.",
+        "Sure, one moment.",
+        "Okay, let me check that for you.",
+    ],
+    "error": [
+        "Sorry, I didn't catch that. Could you say it again?",
+        "Sorry, something went wrong. Please try again.",
+    ],
+    "timeout": [
+        "Response timeout. Please try again.",
+    ],
+}
+
+# Canned answers keyed by a normalized question
+FAQ_ANSWERS = {
+    "what can you do": "I can answer questions about Azure services and help you troubleshoot common issues. Just ask.",
+    "who are you": "I'm the Azure support voice assistant. Ask me anything about your Azure resources.",
+    "how do i contact support": "You can open a support request from the Help and support blade in the Azure portal.",
+}
+
+
+def normalize_question(text):
+    """Normalize a user utterance for FAQ lookup"""
+    text = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return " ".join(text.split())
+
+
+def lookup_faq(user_text):
+    """Return the canned answer for a known question, or None"""
+    return FAQ_ANSWERS.get(normalize_question(user_text))
+
+
+class PhraseBank:
+    """Disk-backed cache of synthesized audio for a fixed set of phrases"""
+
+    def __init__(self, synthesize_fn, cache_dir, voice="default", phrases=None, faq_answers=None):
+        self.synthesize_fn = synthesize_fn
+        self.cache_dir = cache_dir
+        self.voice = voice
+        self.phrases = phrases if phrases is not None else DEFAULT_PHRASES
+        self.known = {text for texts in self.phrases.values() for text in texts}
+        self.known.update((faq_answers if faq_answers is not None else FAQ_ANSWERS).values())
+        self._audio = {}
+        self._scheduled = set()
+        self._failed = {}  # text -> (failure count, retry time)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="phrase-bank")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, text):
+        """On-disk location of a phrase for the current voice"""
+        digest = hashlib.sha1(f"{self.voice}\n{text}".encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.cache_dir, f"{digest}.audio")
+
+    def warm_up(self):
+        """Synthesize every missing phrase in the background; returns immediately"""
+        for text in sorted(self.known):
+            self._schedule(text)
+
+    def get(self, text):
+        """Return cached audio for a known phrase, or None (scheduling synthesis if missing)"""
+        if text not in self.known:
+            return None
+        audio = self._audio.get(text) or self._load(text)
+        if audio is None:
+            self._schedule(text)
+        return audio
+
+    def pick(self, category):
+        """Return audio for a random phrase of `category` that is already available"""
+        texts = [text for text in self.phrases.get(category, []) if self.get(text)]
+        return self._audio[random.choice(texts)] if texts else None
+
+    def _load(self, text):
+        """Load a phrase from disk into memory"""
+        try:
+            with open(self._path(text), "rb") as f:
+                audio = f.read()
+        except OSError:
+            return None
+        self._audio[text] = audio
+        return audio
+
+    def _schedule(self, text):
+        """Queue synthesis of a phrase unless it is cached or already queued"""
+        with self._lock:
+            if text in self._scheduled or text in self._audio or os.path.exists(self._path(text)):
+                return
+            if text in self._failed and time.time() < self._failed[text][1]:
+                return
+            self._scheduled.add(text)
+        self._executor.submit(self._synthesize, text)
+
+    def _synthesize(self, text):
+        """Worker body: synthesize a phrase and persist it atomically"""
+        try:
+            audio = self.synthesize_fn(text)
+            if not audio:
+                self._record_failure(text)
+                return
+            path = self._path(text)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+            self._audio[text] = audio
+            with self._lock:
+                self._failed.pop(text, None)
+        except Exception:
+            # Warm-up is best effort; a failed phrase is synthesized on demand and retried later
+            self._record_failure(text)
+        finally:
+            with self._lock:
+                self._scheduled.discard(text)
+
+    def _record_failure(self, text):
+        """Back off before the next synthesis attempt of a phrase (transient outages recover)"""
+        with self._lock:
+            failures = self._failed.get(text, (0, 0))[0] + 1
+            delay = min(MAX_RETRY_BACKOFF_S, RETRY_BACKOFF_S * 2 ** (failures - 1))
+            self._failed[text] = (failures, time.time() + delay)
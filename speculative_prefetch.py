@@ -0,0 +1,163 @@
+"""
+Speculative LLM prefetch for the voice bot
+Starts the GPT request from stable partial transcripts while the
+recognizer is still waiting for end-of-silence
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# How long a partial hypothesis must stay unchanged before we speculate
+DEFAULT_STABLE_MS = 400
+
+# Rough words-to-tokens ratio used when the endpoint does not report usage
+TOKENS_PER_WORD = 1.3
+
+# Worker threads per session: discarded requests that are already running keep a worker
+# until they finish, so sessions get their own small pool instead of sharing one
+SESSION_WORKERS = 2
+
+# Name prefix of the worker threads, so tracing can tell speculative requests apart
+WORKER_THREAD_PREFIX = "speculative-gpt"
+
+
+def normalize_transcript(text):
+    """Normalize a transcript so partial and final results can be compared"""
+    text = re.sub(r"[^\w\s']", " ", (text or "").lower())
+    return " ".join(text.split())
+
+
+class SpeculativePrefetcher:
+    """Launch a GPT request once partial results stabilize and reuse it on a match"""
+
+    def __init__(self, request_fn, stable_ms=DEFAULT_STABLE_MS, stats=None, executor=None):
+        self.request_fn = request_fn
+        self.stable_ms = stable_ms
+        self.stats = stats if stats is not None else new_speculation_stats()
+        self.executor = executor if executor is not None else new_speculation_executor()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._partial = ""
+        self._pending = None  # (normalized_text, future, usage, timing)
+
+    def on_partial(self, text):
+        """Handle a `recognizing` hypothesis; (re)arm the stability timer"""
+        normalized = normalize_transcript(text)
+        if not normalized:
+            return
+        with self._lock:
+            if normalized == self._partial:
+                return
+            self._partial = normalized
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.stable_ms / 1000.0, self._launch, args=(normalized, text.strip()))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _launch(self, normalized, text):
+        """Start the speculative request if the hypothesis is still current"""
+        with self._lock:
+            if normalized != self._partial:
+                return
+            if self._pending and self._pending[0] == normalized:
+                return
+            self._discard_pending()
+            usage = {}
+            timing = {"started": time.time()}
+            future = self.executor.submit(self._run, text, usage, timing)
+            self._pending = (normalized, future, usage, timing)
+            self.stats["launched"] += 1
+
+    def _run(self, text, usage, timing):
+        """Worker body: call the GPT request function and note when it finished"""
+        try:
+            return self.request_fn(text, usage)
+        finally:
+            timing["finished"] = time.time()
+
+    def resolve(self, final_text):
+        """Return the speculative response if it matches the final transcript and has started, else None"""
+        normalized = normalize_transcript(final_text)
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._partial = ""
+            pending, self._pending = self._pending, None
+
+        if pending and pending[0] == normalized and pending[1].cancel():
+            # Still queued behind discarded requests: a direct request is faster than waiting
+            self.stats["cancelled"] += 1
+            pending = None
+        elif pending and pending[0] == normalized:
+            resolved_at = time.time()
+            response = pending[1].result()
+            timing = pending[3]
+            # Latency hidden behind the silence timeout: request time spent before the final result
+            hidden = min(resolved_at, timing.get("finished", resolved_at)) - timing["started"]
+            self.stats["hits"] += 1
+            self.stats["saved_ms"] += max(0, int(hidden * 1000))
+            return response
+
+        if pending:
+            with self._lock:
+                self._pending = pending
+                self._discard_pending()
+        self.stats["misses"] += 1
+        return None
+
+    def cancel(self):
+        """Drop any armed timer or in-flight speculation (e.g. on recognition errors)"""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._partial = ""
+            self._discard_pending()
+
+    def _discard_pending(self):
+        """Cancel the pending request and account for its wasted tokens (lock held)"""
+        if not self._pending:
+            return
+        _, future, usage, _ = self._pending
+        self._pending = None
+        self.stats["cancelled"] += 1
+        if future.cancel():
+            return
+        # Already running: the request cannot be aborted, so count what it costs
+        future.add_done_callback(lambda f: self._count_wasted(f, usage))
+
+    def _count_wasted(self, future, usage):
+        """Add the tokens spent on a discarded speculative response"""
+        if future.cancelled() or future.exception():
+            return
+        tokens = usage.get("total_tokens")
+        if tokens is None:
+            tokens = int(len(str(future.result()).split()) * TOKENS_PER_WORD)
+        self.stats["wasted_tokens"] += tokens
+
+
+def new_speculation_executor():
+    """Create the worker pool for one session's speculative requests"""
+    return ThreadPoolExecutor(max_workers=SESSION_WORKERS, thread_name_prefix=WORKER_THREAD_PREFIX)
+
+
+def new_speculation_stats():
+    """Create an empty counters dict for speculative prefetching"""
+    return {
+        "launched": 0,
+        "hits": 0,
+        "misses": 0,
+        "cancelled": 0,
+        "wasted_tokens": 0,
+        "saved_ms": 0,
+    }
+
+
+def speculation_hit_rate(stats):
+    """Fraction of turns answered from a speculative response"""
+    turns = stats["hits"] + stats["misses"]
+    return stats["hits"] / turns if turns else 0.0
@@ -0,0 +1,288 @@
+"""
+Pluggable speech engines for the voice bot
+A common recognize/synthesize interface with Azure Speech as one engine and
+local CPU engines (Vosk for recognition, Piper and espeak-ng for synthesis)
+as others, so turns can run on-box without a cloud round trip
+"""
+
+import json
+import os
+import queue
+import shutil
+import subprocess
+import time
+
+from audio_buffer import RECOGNIZER_SAMPLE_RATE, pcm_to_wav
+
+
+class SpeechEngineError(Exception):
+    """Recognition or synthesis failed; the message is shown to the user"""
+
+
+class NoSpeechDetected(SpeechEngineError):
+    """The engine heard nothing it could transcribe"""
+
+
+class SpeechEngine:
+    """Interface every speech engine implements.
+
+    Recognizers take 16 kHz mono int16 samples (see audio_buffer) or listen on the
+    default microphone; synthesizers return WAV bytes. `timeouts` is the dict chosen
+    by the endpointer and `on_partial` receives partial transcripts as they arrive.
+    The `can_*` flags say which of the three methods an engine implements.
+    """
+
+    name = "base"
+    voice = ""
+    can_recognize = False
+    can_listen = False
+    can_synthesize = False
+
+    def transcribe(self, samples, sample_rate=RECOGNIZER_SAMPLE_RATE, timeouts=None, on_partial=None):
+        """Transcribe recorded samples; returns the (possibly empty) transcript"""
+        raise SpeechEngineError(f"The {self.name} engine does not support speech recognition")
+
+    def listen(self, timeouts=None, on_partial=None):
+        """Recognize one utterance from the default microphone"""
+        raise SpeechEngineError(f"The {self.name} engine does not support microphone input")
+
+    def synthesize(self, text):
+        """Synthesize `text` to WAV bytes"""
+        raise SpeechEngineError(f"The {self.name} engine does not support speech synthesis")
+
+
+class AzureSpeechEngine(SpeechEngine):
+    """Azure Speech Services (cloud) recognition and synthesis"""
+
+    name = "azure"
+    can_recognize = True
+    can_listen = True
+    can_synthesize = True
+
+    def __init__(self, speech_config, load_sdk, voice="en-US-AriaNeural", language="en-US"):
+        self.speech_config = speech_config
+        self.load_sdk = load_sdk
+        self.voice = voice
+        self.language = language
+
+    def recognizer_config(self, timeouts=None):
+        """Copy of the speech config with the language and endpointing timeouts applied"""
+        speechsdk = self.load_sdk()
+        temp_config = speechsdk.SpeechConfig(subscription=self.speech_config.subscription_key,
+                                             region=self.speech_config.region)
+        temp_config.speech_recognition_language = self.language
+        if timeouts:
+            temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_InitialSilenceTimeoutMs, str(timeouts["initial_ms"]))
+            temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_EndSilenceTimeoutMs, str(timeouts["end_ms"]))
+            if timeouts["segmentation_ms"] is not None:
+                temp_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs, str(timeouts["segmentation_ms"]))
+        return temp_config
+
+    def transcribe(self, samples, sample_rate=RECOGNIZER_SAMPLE_RATE, timeouts=None, on_partial=None):
+        speechsdk = self.load_sdk()
+        stream_format = speechsdk.audio.AudioStreamFormat(samples_per_second=sample_rate, bits_per_sample=16, channels=1)
+        audio_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.recognizer_config(timeouts),
+            audio_config=speechsdk.audio.AudioConfig(stream=audio_stream)
+        )
+        if on_partial:
+            recognizer.recognizing.connect(lambda evt: on_partial(evt.result.text))
+        # The SDK needs bytes, so this is the only copy of the samples
+        audio_stream.write(samples.tobytes())
+        audio_stream.close()
+        return self._result_text(recognizer.recognize_once())
+
+    def listen(self, timeouts=None, on_partial=None):
+        speechsdk = self.load_sdk()
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.recognizer_config(timeouts),
+            audio_config=speechsdk.audio.AudioConfig(use_default_microphone=True)
+        )
+        if on_partial:
+            recognizer.recognizing.connect(lambda evt: on_partial(evt.result.text))
+        return self._result_text(recognizer.recognize_once_async().get())
+
+    def synthesize(self, text):
+        speechsdk = self.load_sdk()
+        temp_config = speechsdk.SpeechConfig(subscription=self.speech_config.subscription_key,
+                                             region=self.speech_config.region)
+        temp_config.speech_synthesis_voice_name = self.voice
+        # No audio output device: playback happens in the browser
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=temp_config, audio_config=None)
+        result = synthesizer.speak_text_async(text).get()
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_data
+        if result.reason == speechsdk.ResultReason.Canceled:
+            raise SpeechEngineError(f"Speech synthesis failed: {result.cancellation_details.error_details}")
+        raise SpeechEngineError(f"Speech synthesis failed: {result.reason}")
+
+    def _result_text(self, result):
+        """Map an Azure recognition result to a transcript or an engine error"""
+        speechsdk = self.load_sdk()
+        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+            return result.text.strip()
+        elif result.reason == speechsdk.ResultReason.NoMatch:
+            raise NoSpeechDetected("No speech detected.")
+        elif result.reason == speechsdk.ResultReason.Canceled:
+            cancellation_details = result.cancellation_details
+            if cancellation_details.reason == speechsdk.CancellationReason.Error:
+                raise SpeechEngineError(f"Recognition error: {cancellation_details.error_details}")
+            raise SpeechEngineError(f"Recognition canceled: {cancellation_details.reason}")
+        raise SpeechEngineError(f"Unexpected result: {result.reason}")
+
+
+class VoskEngine(SpeechEngine):
+    """Offline CPU recognition with Vosk (Kaldi) models"""
+
+    name = "vosk"
+    can_recognize = True
+    can_listen = True
+
+    # Audio handed to the recognizer per call
+    BLOCK_MS = 100
+    # Longest utterance before the recognizer (or listen) gives up
+    MAX_UTTERANCE_S = 30.0
+
+    def __init__(self, model_path):
+        try:
+            import vosk
+        except ImportError:
+            raise SpeechEngineError("The vosk engine needs the vosk package (pip install vosk)")
+        if not os.path.isdir(model_path):
+            raise SpeechEngineError(f"Vosk model not found at {model_path}")
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def _recognizer(self, sample_rate, timeouts):
+        recognizer = self._vosk.KaldiRecognizer(self.model, sample_rate)
+        if timeouts and hasattr(recognizer, "SetEndpointerDelays"):
+            # Vosk >= 0.3.45: (max leading silence, trailing silence, max utterance) in seconds
+            recognizer.SetEndpointerDelays(timeouts["initial_ms"] / 1000, timeouts["end_ms"] / 1000, self.MAX_UTTERANCE_S)
+        return recognizer
+
+    def transcribe(self, samples, sample_rate=RECOGNIZER_SAMPLE_RATE, timeouts=None, on_partial=None):
+        recognizer = self._recognizer(sample_rate, timeouts)
+        block = sample_rate * self.BLOCK_MS // 1000
+        texts = []
+        for start in range(0, len(samples), block):
+            if recognizer.AcceptWaveform(samples[start:start + block].tobytes()):
+                texts.append(json.loads(recognizer.Result()).get("text", ""))
+            elif on_partial:
+                on_partial(json.loads(recognizer.PartialResult()).get("partial", ""))
+        texts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+        text = " ".join(t for t in texts if t).strip()
+        if not text:
+            raise NoSpeechDetected("No speech detected.")
+        return text
+
+    def listen(self, timeouts=None, on_partial=None):
+        try:
+            import sounddevice
+        except ImportError:
+            raise SpeechEngineError("Microphone input for the vosk engine needs sounddevice (pip install sounddevice)")
+        initial_s = (timeouts or {}).get("initial_ms", 5000) / 1000
+        recognizer = self._recognizer(RECOGNIZER_SAMPLE_RATE, timeouts)
+        blocks = queue.Queue()
+        heard = False
+        silence_started = time.time()
+        # Hard stop even if noise keeps producing partials that never become a transcript
+        deadline = silence_started + initial_s + self.MAX_UTTERANCE_S
+        with sounddevice.RawInputStream(samplerate=RECOGNIZER_SAMPLE_RATE, channels=1, dtype="int16",
+                                        blocksize=RECOGNIZER_SAMPLE_RATE * self.BLOCK_MS // 1000,
+                                        callback=lambda data, frames, when, status: blocks.put(bytes(data))):
+            while True:
+                try:
+                    data = blocks.get(timeout=0.5)
+                except queue.Empty:
+                    data = b""
+                if data and recognizer.AcceptWaveform(data):
+                    text = json.loads(recognizer.Result()).get("text", "").strip()
+                    if text:
+                        return text
+                    # The segment was noise: wait for speech again
+                    heard = False
+                    silence_started = time.time()
+                elif data:
+                    partial = json.loads(recognizer.PartialResult()).get("partial", "")
+                    if partial:
+                        heard = True
+                        if on_partial:
+                            on_partial(partial)
+                now = time.time()
+                if now > deadline or (not heard and now - silence_started > initial_s):
+                    raise NoSpeechDetected("No speech detected.")
+
+
+class PiperEngine(SpeechEngine):
+    """Offline neural synthesis with the Piper CLI"""
+
+    name = "piper"
+    can_synthesize = True
+
+    def __init__(self, model_path, executable="piper"):
+        self.executable = shutil.which(executable)
+        if not self.executable:
+            raise SpeechEngineError(f"Piper executable '{executable}' not found on PATH")
+        if not os.path.isfile(model_path):
+            raise SpeechEngineError(f"Piper voice model not found at {model_path}")
+        self.model_path = model_path
+        self.voice = os.path.basename(model_path)
+        self.sample_rate = 22050
+        try:
+            with open(f"{model_path}.json", "r", encoding="utf-8") as f:
+                self.sample_rate = json.load(f)["audio"]["sample_rate"]
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def synthesize(self, text):
+        result = subprocess.run(
+            [self.executable, "--model", self.model_path, "--output_raw"],
+            input=text.encode("utf-8"), capture_output=True, timeout=30
+        )
+        if result.returncode != 0 or not result.stdout:
+            raise SpeechEngineError(f"Piper synthesis failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return bytes(pcm_to_wav(result.stdout, self.sample_rate))
+
+
+class EspeakEngine(SpeechEngine):
+    """Offline formant synthesis with espeak-ng (tiny, robotic, always available)"""
+
+    name = "espeak"
+    can_synthesize = True
+
+    def __init__(self, voice="en-us", executable="espeak-ng"):
+        self.executable = shutil.which(executable) or shutil.which("espeak")
+        if not self.executable:
+            raise SpeechEngineError(f"'{executable}' not found on PATH")
+        self.voice = voice
+
+    def synthesize(self, text):
+        result = subprocess.run([self.executable, "-v", self.voice, "--stdout", text],
+                                capture_output=True, timeout=30)
+        if result.returncode != 0 or not result.stdout:
+            raise SpeechEngineError(f"espeak synthesis failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+
+# Engines offering each capability, in the order they are offered in the UI
+RECOGNIZERS = ("azure", "vosk")
+SYNTHESIZERS = ("azure", "piper", "espeak")
+
+# Engine name -> factory taking (options, speech_config, load_sdk)
+ENGINES = {
+    "azure": lambda options, speech_config, load_sdk: AzureSpeechEngine(
+        speech_config, load_sdk, voice=options.get("voice", "en-US-AriaNeural")),
+    "vosk": lambda options, speech_config, load_sdk: VoskEngine(options.get("model_path", "models/vosk")),
+    "piper": lambda options, speech_config, load_sdk: PiperEngine(
+        options.get("model_path", "models/piper/en_US-lessac-medium.onnx"), options.get("executable", "piper")),
+    "espeak": lambda options, speech_config, load_sdk: EspeakEngine(options.get("voice", "en-us")),
+}
+
+
+def create_engine(name, options=None, speech_config=None, load_sdk=None):
+    """Instantiate a registered speech engine by name"""
+    if name not in ENGINES:
+        raise SpeechEngineError(f"Unknown speech engine '{name}' (choose from {', '.join(ENGINES)})")
+    return ENGINES[name](options or {}, speech_config, load_sdk)
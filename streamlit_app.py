@@ -1,20 +1,91 @@
+import time
+
+# Measured from the first import so deploy checks can enforce a cold-start budget
+_IMPORT_STARTED = time.perf_counter()
+
 import streamlit as st
-import azure.cognitiveservices.speech as speechsdk
-import openai
 import io
 import base64
-import time
-from audio_recorder_streamlit import audio_recorder
-import requests
+import html
+import re
+import uuid
 import json
+import logging
 import threading
+from functools import lru_cache
+from pathlib import Path
+from audio_buffer import RECOGNIZER_SAMPLE_RATE, to_recognizer_samples
+from conversation_log import ConversationLog
+from endpointing import AdaptiveEndpointer, DEFAULT_ENDPOINTING_CONFIG, FIXED_TIMEOUTS
+from phrase_bank import PhraseBank, lookup_faq
+from speech_engines import (
+    AzureSpeechEngine, NoSpeechDetected, RECOGNIZERS, SYNTHESIZERS, SpeechEngineError, create_engine
+)
+from speculative_prefetch import (
+    SpeculativePrefetcher, new_speculation_executor, new_speculation_stats, speculation_hit_rate
+)
+from turn_trace import TurnTracer
+
+IMPORT_TIME_S = time.perf_counter() - _IMPORT_STARTED
+
+# Heavy SDKs (Azure Speech, requests, gTTS, the browser recorder) are imported on first use
+# through the loaders below, and PyAV inside audio_buffer.decode_compressed, so a cold start
+# only pays for Streamlit and NumPy (which the audio and endpointing modules need up front).
+# This is the one cold-start budget: the app warns above it and deploy.py's check enforces it.
+STARTUP_IMPORT_BUDGET_S = 2.0
+
+# Conversation turns rendered per page; older pages are only rendered on request
+HISTORY_PAGE_SIZE = 5
+
+# Session IDs are uuid4().hex; the `sid` query parameter must look like one
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+CSS_PATH = Path(__file__).parent / "assets" / "style.css"
+
+@lru_cache(maxsize=None)
+def load_speechsdk():
+    """Import the Azure Speech SDK on first use"""
+    import azure.cognitiveservices.speech as speechsdk
+    return speechsdk
+
+@lru_cache(maxsize=None)
+def load_requests():
+    """Import requests on first use"""
+    import requests
+    return requests
+
+@lru_cache(maxsize=None)
+def load_gtts():
+    """Import gTTS for fallback TTS on first use; None if it is not installed"""
+    try:
+        from gtts import gTTS
+        return gTTS
+    except ImportError:
+        return None
 
-# Try to import gTTS for fallback TTS
-try:
-    from gtts import gTTS
-    GTTS_AVAILABLE = True
-except ImportError:
-    GTTS_AVAILABLE = False
+@lru_cache(maxsize=None)
+def load_audio_recorder():
+    """Import the browser audio recorder component on first use"""
+    from audio_recorder_streamlit import audio_recorder
+    return audio_recorder
+
+@st.cache_data(show_spinner=False)
+def load_css():
+    """Read the app stylesheet once and wrap it for st.markdown"""
+    return f"<style>\n{CSS_PATH.read_text(encoding='utf-8')}</style>"
+
+# System prompt sent with every GPT request
+SYSTEM_PROMPT = "You are a helpful assistant. Keep responses concise and conversational."
+
+# Voice used for all synthesized speech, including the pre-synthesized phrase bank
+TTS_VOICE = "en-US-AriaNeural"  # Fast, natural voice
+
+# Per-turn diagnostics (e.g. endpointing decisions) go to the server log
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+if IMPORT_TIME_S > STARTUP_IMPORT_BUDGET_S:
+    logger.warning("Startup imports took %.2fs (budget %.2fs)", IMPORT_TIME_S, STARTUP_IMPORT_BUDGET_S)
 
 # Page configuration
 st.set_page_config(
@@ -26,73 +97,33 @@ st.set_page_config(
 
 # Configuration for cloud deployment
 AUDIO_ENABLED = st.sidebar.checkbox("🎵 Enable Audio Features", value=True, help="Disable if experiencing audio system issues in cloud deployment")
+SPECULATIVE_ENABLED = st.sidebar.checkbox("⚡ Speculative Responses", value=True, help="Start the AI request from partial speech results while waiting for end-of-silence")
+def default_engine_index(secret_name, engines):
+    """Position of the engine named in secrets, or the first engine if the name is unknown"""
+    engine_name = st.secrets.get(secret_name, engines[0])
+    if engine_name in engines:
+        return engines.index(engine_name)
+    logger.warning("Unknown %s '%s' in secrets (choose from %s), using %s",
+                   secret_name, engine_name, ", ".join(engines), engines[0])
+    return 0
 
-# Custom CSS for styling
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        color: #4F46E5;
-        font-size: 2.5rem;
-        font-weight: bold;
-        margin-bottom: 2rem;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-    }
-    
-    .status-box {
-        padding: 1rem;
-        border-radius: 10px;
-        margin: 1rem 0;
-        text-align: center;
-        font-weight: bold;
-    }
-    
-    .status-idle {
-        background-color: #E5E7EB;
-        color: #374151;
-    }
-    
-    .status-listening {
-        background-color: #FEF3C7;
-        color: #92400E;
-    }
-    
-    .status-processing {
-        background-color: #DBEAFE;
-        color: #1E40AF;
-    }
-    
-    .status-speaking {
-        background-color: #D1FAE5;
-        color: #065F46;
-    }
-    
-    .conversation-box {
-        background-color: #F8FAFC;
-        border: 2px solid #E2E8F0;
-        border-radius: 10px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-    }
-    
-    .user-text {
-        background-color: #EBF4FF;
-        border-left: 4px solid #3B82F6;
-        padding: 1rem;
-        border-radius: 5px;
-        margin: 0.5rem 0;
-    }
-    
-    .bot-text {
-        background-color: #F0FDF4;
-        border-left: 4px solid #10B981;
-        padding: 1rem;
-        border-radius: 5px;
-        margin: 0.5rem 0;
-        font-style: italic;
-    }
-</style>
-""", unsafe_allow_html=True)
+STT_ENGINE = st.sidebar.selectbox(
+    "🎙️ Speech Recognition Engine", RECOGNIZERS,
+    index=default_engine_index("STT_ENGINE", RECOGNIZERS),
+    help="Local engines run on this machine with no network round trip"
+)
+TTS_ENGINE = st.sidebar.selectbox(
+    "🔊 Speech Synthesis Engine", SYNTHESIZERS,
+    index=default_engine_index("TTS_ENGINE", SYNTHESIZERS),
+    help="Local engines run on this machine with no network round trip"
+)
+TRACE_ENABLED = st.sidebar.checkbox(
+    "🧾 Record Turn Traces", value=bool(st.secrets.get("TRACE_ENABLED", False)),
+    help="Save audio, transcripts, prompts and timings of each turn for offline replay"
+)
+
+# Custom CSS for styling (read from disk once per process)
+st.markdown(load_css(), unsafe_allow_html=True)
 
 def initialize_session_state():
     """Initialize session state variables"""
@@ -102,8 +133,18 @@ def initialize_session_state():
         st.session_state.user_text = ""
     if 'bot_response' not in st.session_state:
         st.session_state.bot_response = ""
+    if 'session_id' not in st.session_state:
+        # Kept in the URL so a page reload resumes the same conversation;
+        # anything that is not one of our own IDs gets a fresh session
+        sid = st.query_params.get("sid") or ""
+        st.session_state.session_id = sid if SESSION_ID_PATTERN.fullmatch(sid) else uuid.uuid4().hex
+        st.query_params["sid"] = st.session_state.session_id
     if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
+        st.session_state.conversation_history = resume_conversation(st.session_state.session_id)
+    if 'history_pages' not in st.session_state:
+        st.session_state.history_pages = 1
+    if 'playing_turn' not in st.session_state:
+        st.session_state.playing_turn = None
     if 'listening_active' not in st.session_state:
         st.session_state.listening_active = False
     if 'continuous_listening' not in st.session_state:
@@ -112,9 +153,16 @@ def initialize_session_state():
         st.session_state.auto_listen_trigger = 0
     if 'conversation_count' not in st.session_state:
         st.session_state.conversation_count = 0
+    if 'speculation_stats' not in st.session_state:
+        st.session_state.speculation_stats = new_speculation_stats()
+    if 'speculation_executor' not in st.session_state:
+        st.session_state.speculation_executor = new_speculation_executor()
+    if 'endpointer' not in st.session_state:
+        st.session_state.endpointer = AdaptiveEndpointer(get_endpointing_config())
 
 def get_azure_speech_config():
     """Get Azure Speech configuration from secrets"""
+    speechsdk = load_speechsdk()
     try:
         subscription_key = st.secrets["AZURE_SPEECH_KEY"]
         service_region = st.secrets["AZURE_SPEECH_REGION"]
@@ -136,20 +184,61 @@ def get_openai_config():
         st.error("Please add OPENAI_ENDPOINT and OPENAI_API_KEY to your Streamlit secrets.")
         return None
 
-def continuous_speech_recognition(speech_config, openai_config, placeholder_container):
+def get_endpointing_config():
+    """Get adaptive endpointing configuration from secrets, falling back to defaults"""
+    config = {}
+    for name, default in DEFAULT_ENDPOINTING_CONFIG.items():
+        value = st.secrets.get(f"ENDPOINTING_{name.upper()}", default)
+        config[name] = type(default)(value)
+    return config
+
+def choose_timeouts(endpointer, context):
+    """Ask the session endpointer for timeouts, or use the fixed ones without it"""
+    if endpointer is None:
+        return FIXED_TIMEOUTS[context]
+    return endpointer.choose_timeouts(context)
+
+@st.cache_resource(show_spinner=False)
+def create_speech_engine(engine_name, _speech_config):
+    """Create (once per process) a speech engine configured from the [speech_engines] secrets"""
+    options = dict(st.secrets.get("speech_engines", {}).get(engine_name, {}))
+    if engine_name == "azure":
+        options.setdefault("voice", TTS_VOICE)
+    return create_engine(engine_name, options, _speech_config, load_speechsdk)
+
+def get_speech_engine(engine_name, speech_config, capability):
+    """Return the named speech engine, falling back to Azure if it is unavailable here or lacks `capability`"""
+    try:
+        engine = create_speech_engine(engine_name, speech_config)
+    except SpeechEngineError as e:
+        if engine_name == "azure":
+            raise
+        logger.warning("Speech engine %s unavailable, using Azure: %s", engine_name, e)
+        return create_speech_engine("azure", speech_config)
+    if not getattr(engine, capability) and engine_name != "azure":
+        logger.warning("Speech engine %s does not support %s, using Azure", engine_name, capability)
+        return create_speech_engine("azure", speech_config)
+    return engine
+
+def select_recognizer(engine_name, sample_count):
+    """Pick the recognizer for a recorded clip; short utterances may be routed to a local engine"""
+    short_engine = st.secrets.get("SHORT_UTTERANCE_ENGINE")
+    short_ms = int(st.secrets.get("SHORT_UTTERANCE_MS", 3000))
+    if engine_name is None and short_engine and sample_count * 1000 <= short_ms * RECOGNIZER_SAMPLE_RATE:
+        return short_engine
+    return engine_name or STT_ENGINE
+
+def continuous_speech_recognition(speech_config, openai_config, placeholder_container, endpointer=None):
     """Continuous speech recognition with immediate processing"""
+    speechsdk = load_speechsdk()
     try:
         # Create audio configuration from default microphone
         audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
         
-        # Create a copy of speech config
-        temp_config = speechsdk.SpeechConfig(subscription=speech_config.subscription_key, region=speech_config.region)
-        temp_config.speech_recognition_language = "en-US"
-        
-        # Set optimized properties for continuous recognition
-        temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_InitialSilenceTimeoutMs, "3000")
-        temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_EndSilenceTimeoutMs, "1000")
-        temp_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs, "1000")
+        # Copy of the speech config with endpointing timeouts for continuous recognition
+        # (continuous recognition relies on Azure's event stream, so it is Azure-only)
+        azure_engine = AzureSpeechEngine(speech_config, load_speechsdk, voice=TTS_VOICE)
+        temp_config = azure_engine.recognizer_config(choose_timeouts(endpointer, "continuous"))
         
         # Create speech recognizer
         speech_recognizer = speechsdk.SpeechRecognizer(
@@ -174,12 +263,7 @@ def continuous_speech_recognition(speech_config, openai_config, placeholder_cont
                         audio_data = text_to_speech(bot_response, speech_config)
                         
                         # Add to conversation history
-                        st.session_state.conversation_history.append({
-                            "user": user_text,
-                            "bot": bot_response,
-                            "audio": audio_data,
-                            "timestamp": time.time()
-                        })
+                        add_conversation_turn(user_text, bot_response, audio_data)
                         
                         # Play audio response
                         if audio_data:
@@ -187,6 +271,10 @@ def continuous_speech_recognition(speech_config, openai_config, placeholder_cont
         
         # Set up event handlers
         speech_recognizer.recognized.connect(recognized_handler)
+        if endpointer is not None:
+            speech_recognizer.recognizing.connect(lambda evt: endpointer.observe_partial(evt.result.text))
+            # The microphone stays open between phrases, so quick resumptions reveal cut-off turns
+            speech_recognizer.recognized.connect(lambda evt: endpointer.end_utterance(mic_live=True))
         
         # Start continuous recognition
         speech_recognizer.start_continuous_recognition()
@@ -196,99 +284,99 @@ def continuous_speech_recognition(speech_config, openai_config, placeholder_cont
     except Exception as e:
         return f"Continuous recognition error: {str(e)}"
 
-def direct_microphone_recognition(speech_config):
-    """Use Azure Speech SDK's direct microphone access for recognition"""
+def microphone_recognition(speech_config, endpointer=None, engine_name=None, prefetcher=None):
+    """Recognize one utterance from the default microphone with the selected speech engine.
+
+    Returns (user_text, prefetched response or None). Partial results teach the endpointer
+    and, with a `prefetcher`, start speculative GPT requests; the prefetcher is always
+    resolved or cancelled before this returns.
+    """
+    resolving = False
+    
+    def on_partial(text):
+        # Feed partial hypotheses to the prefetcher while the recognizer waits for silence
+        if prefetcher is not None:
+            prefetcher.on_partial(text)
+        if endpointer is not None:
+            endpointer.observe_partial(text)
+    
     try:
-        # Create audio configuration from default microphone
-        audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
-        
-        # Create a copy of speech config
-        temp_config = speechsdk.SpeechConfig(subscription=speech_config.subscription_key, region=speech_config.region)
-        temp_config.speech_recognition_language = "en-US"
-        
-        # Set optimized properties
-        temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_InitialSilenceTimeoutMs, "5000")
-        temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_EndSilenceTimeoutMs, "3000")
-        
-        # Create speech recognizer
-        speech_recognizer = speechsdk.SpeechRecognizer(
-            speech_config=temp_config,
-            audio_config=audio_config
-        )
+        engine = get_speech_engine(engine_name or STT_ENGINE, speech_config, "can_listen")
+        if endpointer is not None:
+            endpointer.start_utterance()
         
         # Perform recognition
-        result = speech_recognizer.recognize_once()
-        
-        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-            return result.text.strip() if result.text.strip() else "Empty recognition result."
-        elif result.reason == speechsdk.ResultReason.NoMatch:
-            return "No speech detected. Please try again."
-        elif result.reason == speechsdk.ResultReason.Canceled:
-            cancellation_details = result.cancellation_details
-            if cancellation_details.reason == speechsdk.CancellationReason.Error:
-                return f"Recognition error: {cancellation_details.error_details}"
-            else:
-                return f"Recognition canceled: {cancellation_details.reason}"
-        else:
-            return f"Unexpected result: {result.reason}"
-            
+        user_text = engine.listen(choose_timeouts(endpointer, "direct"), on_partial)
+        if not user_text:
+            return "Empty recognition result.", None
+        if endpointer is not None:
+            endpointer.end_utterance()
+        resolving = prefetcher is not None
+        return user_text, prefetcher.resolve(user_text) if resolving else None
+        
+    except NoSpeechDetected:
+        return "No speech detected. Please try again.", None
+    except SpeechEngineError as e:
+        return str(e), None
     except Exception as e:
-        return f"Direct microphone error: {str(e)}"
+        return f"Direct microphone error: {str(e)}", None
+    finally:
+        if prefetcher is not None and not resolving:
+            prefetcher.cancel()
+
+def direct_microphone_recognition(speech_config, endpointer=None, engine_name=None):
+    """Recognize one utterance from the default microphone with the selected speech engine"""
+    return microphone_recognition(speech_config, endpointer, engine_name)[0]
+
+def speculative_microphone_recognition(speech_config, openai_config, stats, endpointer=None, engine_name=None,
+                                       executor=None):
+    """Direct microphone recognition that prefetches the GPT response from partial results.
 
-def speech_to_text(audio_data, speech_config):
-    """Convert audio to text using Azure Speech Services with improved handling"""
+    Returns (user_text, bot_response); bot_response is None when the speculative
+    request did not match the final transcript and the caller must ask GPT itself.
+    """
+    prefetcher = SpeculativePrefetcher(
+        lambda text, usage: get_gpt_response(text, openai_config, usage=usage),
+        stats=stats, executor=executor
+    )
+    return microphone_recognition(speech_config, endpointer, engine_name, prefetcher)
+
+def speech_to_text(audio_data, speech_config, endpointer=None, engine_name=None):
+    """Convert recorded audio to text with the selected speech engine"""
     try:
         # Check if audio data is valid
         if not audio_data or len(audio_data) < 1000:  # Less than ~0.1 seconds of audio
             return "Audio too short or empty. Please record for at least 1-2 seconds."
         
-        # Create a copy of speech config to avoid modifying the original
-        temp_config = speechsdk.SpeechConfig(subscription=speech_config.subscription_key, region=speech_config.region)
-        temp_config.speech_recognition_language = "en-US"
-        
-        # Set optimized properties for better recognition
-        temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_InitialSilenceTimeoutMs, "5000")
-        temp_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_EndSilenceTimeoutMs, "2000")
-        temp_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs, "2000")
-        
-        # Create audio stream and configuration
-        audio_stream = speechsdk.audio.PushAudioInputStream()
-        audio_config = speechsdk.audio.AudioConfig(stream=audio_stream)
-        
-        # Create speech recognizer
-        speech_recognizer = speechsdk.SpeechRecognizer(
-            speech_config=temp_config, 
-            audio_config=audio_config
-        )
+        # Convert whatever the browser recorded to the recognizer's 16 kHz mono PCM in-process
+        try:
+            samples = to_recognizer_samples(audio_data)
+        except ValueError as e:
+            return f"Error in speech recognition: {str(e)}"
         
-        # Push audio data to the stream
-        audio_stream.write(audio_data)
-        audio_stream.close()
+        # Learn the speaker's pauses from the clip with local VAD (recorded clips keep fixed timeouts)
+        if endpointer is not None:
+            endpointer.observe_audio(samples, RECOGNIZER_SAMPLE_RATE)
+        timeouts = choose_timeouts(endpointer, "recorded")
         
         # Perform recognition
-        result = speech_recognizer.recognize_once()
-        
-        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-            if result.text.strip():
-                return result.text.strip()
-            else:
-                return "Empty recognition result. Please speak more clearly."
-        elif result.reason == speechsdk.ResultReason.NoMatch:
-            return "No speech detected. Please speak louder and more clearly."
-        elif result.reason == speechsdk.ResultReason.Canceled:
-            cancellation_details = result.cancellation_details
-            if cancellation_details.reason == speechsdk.CancellationReason.Error:
-                return f"Recognition error: {cancellation_details.error_details}"
-            else:
-                return f"Recognition canceled: {cancellation_details.reason}"
-        else:
-            return f"Unexpected recognition result: {result.reason}"
-        
+        engine = get_speech_engine(select_recognizer(engine_name, len(samples)), speech_config, "can_recognize")
+        user_text = engine.transcribe(samples, RECOGNIZER_SAMPLE_RATE, timeouts)
+        return user_text if user_text else "Empty recognition result. Please speak more clearly."
+        
+    except NoSpeechDetected:
+        return "No speech detected. Please speak louder and more clearly."
+    except SpeechEngineError as e:
+        return str(e)
     except Exception as e:
         return f"Error in speech recognition: {str(e)}"
 
-def get_gpt_response(user_input, openai_config):
-    """Get response from OpenAI GPT with optimized settings"""
+def get_gpt_response(user_input, openai_config, usage=None):
+    """Get response from OpenAI GPT with optimized settings.
+
+    If a `usage` dict is given it is filled with the token usage reported by the endpoint.
+    """
+    requests = load_requests()
     try:
         headers = {
             "Content-Type": "application/json",
@@ -297,7 +385,7 @@ def get_gpt_response(user_input, openai_config):
         
         data = {
             "messages": [
-                {"role": "system", "content": "You are a helpful assistant. Keep responses concise and conversational."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_input}
             ],
             "max_tokens": 150,  # Reduced for faster responses
@@ -315,6 +403,8 @@ def get_gpt_response(user_input, openai_config):
         
         if response.status_code == 200:
             result = response.json()
+            if usage is not None:
+                usage.update(result.get("usage") or {})
             return result["choices"][0]["message"]["content"].strip()
         else:
             return f"Error: {response.status_code} - {response.text}"
@@ -324,31 +414,26 @@ def get_gpt_response(user_input, openai_config):
     except Exception as e:
         return f"Error getting GPT response: {str(e)}"
 
-def text_to_speech(text, speech_config):
-    """Convert text to speech using Azure Speech Services with optimization and fallback"""
+def text_to_speech(text, speech_config, engine_name=None):
+    """Convert text to speech with the selected speech engine, with optimization and fallback"""
     # Check if audio is enabled
     if not AUDIO_ENABLED:
         st.info("🔇 Audio features are disabled. Enable in sidebar if needed.")
         return None
     
+    # Serve pre-synthesized phrases (errors, timeouts, FAQ answers) instantly
+    cached_audio = get_phrase_bank(engine_name or TTS_ENGINE, speech_config).get(text)
+    if cached_audio:
+        return cached_audio
+    
     try:
         # Limit text length for faster synthesis
         if len(text) > 300:
             text = text[:300] + "..."
         
-        # Create speech synthesizer with faster voice
-        speech_config.speech_synthesis_voice_name = "en-US-AriaNeural"  # Fast, natural voice
-        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config)
-        
-        # Synthesize speech with timeout
-        result = synthesizer.speak_text_async(text).get()
-        
-        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            # Return audio data for playback
-            return result.audio_data
-        else:
-            st.error(f"Speech synthesis failed: {result.reason}")
-            return None
+        # Synthesize speech with the selected engine
+        engine = get_speech_engine(engine_name or TTS_ENGINE, speech_config, "can_synthesize")
+        return engine.synthesize(text)
             
     except Exception as e:
         error_msg = str(e)
@@ -377,13 +462,16 @@ def text_to_speech(text, speech_config):
             """)
             
             # Try fallback TTS if available
-            if GTTS_AVAILABLE:
+            if load_gtts():
                 st.info("🔄 Trying fallback text-to-speech...")
                 fallback_audio = fallback_text_to_speech(text)
                 if fallback_audio:
                     st.success("✅ Fallback TTS successful!")
                     return fallback_audio
             
+            return None
+        elif isinstance(e, SpeechEngineError):
+            st.error(error_msg)
             return None
         else:
             st.error(f"Unexpected error in text-to-speech: {error_msg}")
@@ -391,7 +479,8 @@ def text_to_speech(text, speech_config):
 
 def fallback_text_to_speech(text):
     """Fallback text-to-speech using gTTS when Azure Speech fails"""
-    if not GTTS_AVAILABLE:
+    gTTS = load_gtts()
+    if not gTTS:
         return None
     
     try:
@@ -399,16 +488,36 @@ def fallback_text_to_speech(text):
         tts = gTTS(text=text, lang='en', slow=False)
         
         # Save to bytes buffer
-        audio_buffer = io.BytesIO()
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
+        mp3_buffer = io.BytesIO()
+        tts.write_to_fp(mp3_buffer)
         
-        return audio_buffer.read()
+        return mp3_buffer.getvalue()
         
     except Exception as e:
         st.warning(f"Fallback TTS also failed: {str(e)}")
         return None
 
+def synthesize_phrase(text, engine):
+    """Synthesize a phrase-bank entry without touching the UI (runs on a background thread).
+
+    Returns None on failure so the phrase bank retries later; a fallback voice is never
+    cached under the engine's voice.
+    """
+    try:
+        return engine.synthesize(text)
+    except Exception as e:
+        logger.warning("Phrase synthesis with %s failed: %s", engine.name, e)
+        return None
+
+@st.cache_resource(show_spinner=False)
+def get_phrase_bank(engine_name, _speech_config):
+    """Create the phrase bank for a synthesis engine and start warming it up in the background"""
+    engine = get_speech_engine(engine_name, _speech_config, "can_synthesize")
+    cache_dir = st.secrets.get("PHRASE_CACHE_DIR", ".phrase_cache")
+    bank = PhraseBank(lambda text: synthesize_phrase(text, engine), cache_dir, voice=f"{engine.name}:{engine.voice}")
+    bank.warm_up()
+    return bank
+
 def display_status(status):
     """Display current status with styling"""
     status_class = {
@@ -421,6 +530,104 @@ def display_status(status):
     st.markdown(f'<div class="status-box {status_class}">Status: {status}</div>', 
                 unsafe_allow_html=True)
 
+def display_speculation_stats(stats):
+    """Show speculative prefetch counters in the sidebar"""
+    st.sidebar.markdown("**⚡ Speculative Responses**")
+    st.sidebar.write(f"Hit rate: {speculation_hit_rate(stats):.0%} "
+                     f"({stats['hits']} hits / {stats['misses']} misses)")
+    st.sidebar.write(f"Latency hidden: {stats['saved_ms']} ms")
+    st.sidebar.write(f"Wasted tokens: {stats['wasted_tokens']} ({stats['cancelled']} cancelled)")
+
+def display_endpointing(endpointer):
+    """Show the endpointing delay chosen for recent turns in the sidebar"""
+    st.sidebar.markdown(f"**⏱️ Endpointing ({endpointer.config['mode']})**")
+    if not endpointer.decisions:
+        st.sidebar.write("No turns yet")
+        return
+    last = endpointer.decisions[-1]
+    st.sidebar.write(f"Last turn: {last['end_ms']} ms end-of-silence ({last['saved_ms']:+d} ms vs fixed)")
+    st.sidebar.caption(last["reason"])
+
+def build_conversation_turn(turn_id, user_text, bot_response, audio_data, timestamp):
+    """Create a history entry with its pre-rendered HTML"""
+    return {
+        "id": turn_id,
+        "user": user_text,
+        "bot": bot_response,
+        "audio": audio_data,
+        "html": (
+            f'<div class="user-text"><strong>You said:</strong><br>{html.escape(user_text)}</div>'
+            f'<div class="bot-text"><strong>Bot replied:</strong><br>{html.escape(bot_response)}</div>'
+        ),
+        "timestamp": timestamp
+    }
+
+def add_conversation_turn(user_text, bot_response, audio_data):
+    """Append a turn to the history with a stable ID and queue it for the durable log"""
+    turn = build_conversation_turn(uuid.uuid4().hex, user_text, bot_response, audio_data, time.time())
+    st.session_state.conversation_history.append(turn)
+    get_conversation_log().append(st.session_state.session_id, {
+        key: turn[key] for key in ("id", "user", "bot", "audio", "timestamp")
+    })
+
+@st.cache_resource(show_spinner=False)
+def get_conversation_log():
+    """Open the process-wide conversation log (its writer thread flushes in the background)"""
+    return ConversationLog(st.secrets.get("CONVERSATION_LOG_DIR", ".conversation_log"))
+
+def resume_conversation(session_id):
+    """Load the last turns of a session from the durable log, skipping records that are incomplete"""
+    conversation_log = get_conversation_log()
+    limit = int(st.secrets.get("RESUME_TURNS", HISTORY_PAGE_SIZE * 4))
+    turns = []
+    for record in conversation_log.load_recent(session_id, limit):
+        try:
+            turns.append(build_conversation_turn(
+                record["id"], record["user"], record["bot"],
+                conversation_log.load_audio(record["audio_ref"]) if record.get("audio_ref") else None,
+                record["timestamp"]
+            ))
+        except (KeyError, TypeError, AttributeError):
+            logger.warning("Skipping malformed conversation log record for session %s", session_id)
+    return turns
+
+@st.fragment
+def render_conversation():
+    """Render a fixed-size window of the conversation, newest first.
+
+    Only the newest turn (and one turn the user chose to replay) gets an audio
+    player, so each rerun costs the same no matter how long the conversation is.
+    Runs as a fragment: paging and replay clicks rerun just the transcript.
+    """
+    history = st.session_state.conversation_history
+    if not history:
+        return
+    
+    st.markdown("### 💬 Conversation:")
+    
+    visible = history[-HISTORY_PAGE_SIZE * st.session_state.history_pages:]
+    newest_id = history[-1]["id"]
+    for conv in reversed(visible):
+        with st.container():
+            st.markdown(conv["html"], unsafe_allow_html=True)
+            
+            # Play audio response: inline for the newest turn, on demand for older ones
+            if not conv.get("audio"):
+                st.warning("⚠️ Audio generation failed for this response")
+            elif conv["id"] in (newest_id, st.session_state.playing_turn):
+                st.audio(conv["audio"], format="audio/wav")
+            elif st.button("🔊 Play response", key=f"play_{conv['id']}"):
+                st.session_state.playing_turn = conv["id"]
+                st.rerun(scope="fragment")
+            
+            st.markdown("---")
+    
+    if len(visible) < len(history):
+        remaining = len(history) - len(visible)
+        if st.button(f"⬇️ Show older messages ({remaining} more)", key="history_older"):
+            st.session_state.history_pages += 1
+            st.rerun(scope="fragment")
+
 def main():
     """Main Streamlit application"""
     initialize_session_state()
@@ -436,9 +643,16 @@ def main():
     if not speech_config or not openai_config:
         st.stop()
     
+    # Pre-synthesized acknowledgements and error prompts (warmed up in the background)
+    phrase_bank = get_phrase_bank(TTS_ENGINE, speech_config)
+    
     # Status display
     display_status(st.session_state.status)
     
+    if SPECULATIVE_ENABLED:
+        display_speculation_stats(st.session_state.speculation_stats)
+    display_endpointing(st.session_state.endpointer)
+    
     # Always use direct microphone and continuous mode (simplified UX)
     use_direct_mic = True
     continuous_mode = True
@@ -483,27 +697,38 @@ def main():
                     st.markdown("🟢 **Ready to listen... Speak now!**")
                     
                     # Automatically start listening
+                    prefetched_response = None
                     with st.spinner("🎤 Listening... Speak now!"):
-                        user_text = direct_microphone_recognition(speech_config)
+                        if SPECULATIVE_ENABLED:
+                            user_text, prefetched_response = speculative_microphone_recognition(
+                                speech_config, openai_config, st.session_state.speculation_stats,
+                                st.session_state.endpointer, executor=st.session_state.speculation_executor
+                            )
+                        else:
+                            user_text = direct_microphone_recognition(speech_config, st.session_state.endpointer)
                         
                     if user_text and "Error" not in user_text and "No speech" not in user_text and "Empty" not in user_text:
                         # Process the recognized speech
                         st.session_state.status = "Processing"
                         
+                        # Answer known questions and matched speculations immediately
+                        ready_response = lookup_faq(user_text) or prefetched_response
+                        
+                        # Fill the dead air with a pre-synthesized acknowledgement while GPT runs
+                        if not ready_response and AUDIO_ENABLED:
+                            filler_audio = phrase_bank.pick("acknowledgement")
+                            if filler_audio:
+                                st.audio(filler_audio, format="audio/wav", autoplay=True)
+                        
                         with st.spinner("🤖 Processing your request..."):
-                            # Get GPT response
-                            bot_response = get_gpt_response(user_text, openai_config)
+                            # Get GPT response (reuse the speculative one when it matched)
+                            bot_response = ready_response or get_gpt_response(user_text, openai_config)
                             
                             # Generate audio
                             audio_data = text_to_speech(bot_response, speech_config)
                             
                             # Add to conversation history
-                            st.session_state.conversation_history.append({
-                                "user": user_text,
-                                "bot": bot_response,
-                                "audio": audio_data,
-                                "timestamp": time.time()
-                            })
+                            add_conversation_turn(user_text, bot_response, audio_data)
                             
                             # Increment conversation count
                             st.session_state.conversation_count += 1
@@ -533,6 +758,9 @@ def main():
                         else:
                             st.error(f"❌ Speech recognition issue: {user_text}")
                             st.info("🔄 Trying to listen again...")
+                            error_audio = phrase_bank.pick("error") if AUDIO_ENABLED else None
+                            if error_audio:
+                                st.audio(error_audio, format="audio/wav", autoplay=True)
                         
                         # Auto-retry after brief pause
                         time.sleep(1)
@@ -547,10 +775,11 @@ def main():
             st.markdown("**Direct Microphone Mode**")
             if st.button("🎤 Start Listening", type="primary"):
                 with st.spinner("Listening... Speak now!"):
-                    user_text = direct_microphone_recognition(speech_config)
+                    user_text = direct_microphone_recognition(speech_config, st.session_state.endpointer)
                     st.write(f"🗣️ Recognized: {user_text}")
         else:
             st.markdown("**Browser Recording Mode**")
+            audio_recorder = load_audio_recorder()
             audio_bytes = audio_recorder(
                 text="Click to record",
                 recording_color="#e74c3c",
@@ -573,7 +802,7 @@ def main():
             if user_text is None:  # From audio recorder
                 st.session_state.status = "Converting speech to text..."
                 progress_bar.progress(25)
-                user_text = speech_to_text(audio_bytes, speech_config)
+                user_text = speech_to_text(audio_bytes, speech_config, st.session_state.endpointer)
                 progress_bar.progress(50)
             else:  # From direct microphone
                 progress_bar.progress(50)
@@ -585,7 +814,7 @@ def main():
                 st.session_state.status = "Getting AI response..."
                 progress_bar.progress(75)
                 
-                bot_response = get_gpt_response(user_text, openai_config)
+                bot_response = lookup_faq(user_text) or get_gpt_response(user_text, openai_config)
                 st.session_state.bot_response = bot_response
                 
                 # Convert response to speech (always enabled)
@@ -594,12 +823,7 @@ def main():
                 audio_data = text_to_speech(bot_response, speech_config)
                 
                 # Add to conversation history
-                st.session_state.conversation_history.append({
-                    "user": user_text,
-                    "bot": bot_response,
-                    "audio": audio_data,
-                    "timestamp": time.time()
-                })
+                add_conversation_turn(user_text, bot_response, audio_data)
                 
                 progress_bar.progress(100)
                 st.session_state.status = "Idle"
@@ -611,23 +835,7 @@ def main():
         st.rerun()
     
     # Display conversation
-    if st.session_state.conversation_history:
-        st.markdown("### 💬 Conversation:")
-        
-        for i, conv in enumerate(reversed(st.session_state.conversation_history[-5:])):  # Show last 5 conversations
-            with st.container():
-                st.markdown(f'<div class="user-text"><strong>You said:</strong><br>{conv["user"]}</div>', 
-                           unsafe_allow_html=True)
-                st.markdown(f'<div class="bot-text"><strong>Bot replied:</strong><br>{conv["bot"]}</div>', 
-                           unsafe_allow_html=True)
-                
-                # Play audio response
-                if conv.get("audio"):
-                    st.audio(conv["audio"], format="audio/wav")
-                else:
-                    st.warning("⚠️ Audio generation failed for this response")
-                
-                st.markdown("---")
+    render_conversation()
     
     # Instructions
     with st.expander("ℹ️ How to use"):
@@ -643,11 +851,38 @@ def main():
     
     # Clear conversation button
     if st.button("🗑️ Clear Conversation"):
+        # The log is append-only: start a fresh session instead of deleting the old one
+        st.session_state.session_id = uuid.uuid4().hex
+        st.query_params["sid"] = st.session_state.session_id
         st.session_state.conversation_history = []
+        st.session_state.history_pages = 1
+        st.session_state.playing_turn = None
         st.session_state.user_text = ""
         st.session_state.bot_response = ""
         st.session_state.status = "Idle"
         st.rerun()
 
+def get_turn_tracer():
+    """Per-session tracer writing one trace file per turn"""
+    if 'turn_tracer' not in st.session_state:
+        st.session_state.turn_tracer = TurnTracer(st.secrets.get("TRACE_DIR", ".traces"))
+    # Sidebar settings can change between runs and the session ID is set in main();
+    # read them when each turn begins
+    st.session_state.turn_tracer.metadata = lambda: {
+        "session_id": st.session_state.get("session_id"),
+        "stt_engine": STT_ENGINE, "tts_engine": TTS_ENGINE, "speculative": SPECULATIVE_ENABLED
+    }
+    return st.session_state.turn_tracer
+
+# Opt-in tracing: wrap the pipeline stages for this run
+if TRACE_ENABLED:
+    _tracer = get_turn_tracer()
+    speech_to_text = _tracer.wrap_speech_to_text(speech_to_text)
+    direct_microphone_recognition = _tracer.wrap_microphone(direct_microphone_recognition)
+    speculative_microphone_recognition = _tracer.wrap_microphone(speculative_microphone_recognition)
+    get_gpt_response = _tracer.wrap_llm(get_gpt_response, SYSTEM_PROMPT)
+    text_to_speech = _tracer.wrap_text_to_speech(text_to_speech)
+    st.sidebar.caption(f"🧾 {_tracer.saved} turn traces saved to {_tracer.trace_dir}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Record-and-replay tracing for voice bot turns
+Captures input audio, transcripts, prompts, response timings and synthesized
+audio per turn into a compact zip, and replays traces offline through the app's
+pipeline with recorded stand-ins for Azure and OpenAI so changes can be benchmarked
+"""
+
+import argparse
+import contextlib
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from audio_buffer import RECOGNIZER_SAMPLE_RATE
+from speculative_prefetch import WORKER_THREAD_PREFIX, normalize_transcript
+from speech_engines import NoSpeechDetected, SpeechEngine
+
+TRACE_FORMAT_VERSION = 1
+
+# App functions the tracer wraps; replays call the unwrapped originals
+TRACED_STAGES = ("speech_to_text", "direct_microphone_recognition", "speculative_microphone_recognition",
+                 "get_gpt_response", "text_to_speech")
+
+# Replays skip the phrase bank so every response goes through the synthesis stand-in
+NO_PHRASES = SimpleNamespace(get=lambda text: None, pick=lambda category: None)
+
+
+class TurnTrace:
+    """Events and audio blobs captured for one turn"""
+
+    def __init__(self, metadata=None):
+        self.turn_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.metadata = metadata or {}
+        self.events = []
+        self.blobs = {}
+
+    def now_ms(self):
+        """Milliseconds since the turn started"""
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    def event(self, stage, kind, **data):
+        """Record a timestamped event (list.append is atomic, so callers may be on any thread)"""
+        self.events.append({"t_ms": self.now_ms(), "stage": stage, "kind": kind,
+                            "thread": threading.current_thread().name, **data})
+
+    def blob(self, name, data):
+        """Attach binary data (audio) and return the name it is stored under"""
+        if not data:
+            return None
+        name = f"{len(self.blobs):02d}-{name}"
+        self.blobs[name] = bytes(data)
+        return name
+
+    def save(self, path):
+        """Write the trace as a zip: turn.json plus one compressed member per blob"""
+        manifest = {
+            "version": TRACE_FORMAT_VERSION,
+            "turn_id": self.turn_id,
+            "started_at": self.started_at,
+            "metadata": self.metadata,
+            "events": self.events,
+        }
+        tmp_path = f"{path}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("turn.json", json.dumps(manifest, ensure_ascii=False, indent=1))
+            for name, data in self.blobs.items():
+                archive.writestr(f"blobs/{name}", data)
+        os.replace(tmp_path, path)
+        return path
+
+
+def load_manifest(path):
+    """Read only the manifest (metadata and events) of a saved trace"""
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read("turn.json"))
+
+
+def load_trace(path):
+    """Read a saved trace; returns (manifest, blobs)"""
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read("turn.json"))
+        blobs = {name[len("blobs/"):]: archive.read(name)
+                 for name in archive.namelist() if name.startswith("blobs/")}
+    return manifest, blobs
+
+
+class TurnTracer:
+    """Opt-in tracer: wraps the pipeline stages and writes one trace file per turn.
+
+    `metadata` is a dict, or a function returning one that is called as each turn begins.
+    """
+
+    def __init__(self, trace_dir, metadata=None):
+        self.trace_dir = trace_dir
+        self.metadata = metadata or {}
+        self.current = None
+        self.saved = 0
+        os.makedirs(trace_dir, exist_ok=True)
+
+    def begin_turn(self):
+        """Start a new turn, flushing any turn that never reached synthesis"""
+        self.end_turn()
+        self.current = TurnTrace(dict(self.metadata() if callable(self.metadata) else self.metadata))
+        return self.current
+
+    def end_turn(self):
+        """Save the current turn in the background so the turn path never waits on disk"""
+        trace, self.current = self.current, None
+        if trace is None or not trace.events:
+            return None
+        path = os.path.join(self.trace_dir, f"turn-{time.strftime('%Y%m%d-%H%M%S')}-{trace.turn_id[:8]}.zip")
+        threading.Thread(target=trace.save, args=(path,), name="turn-trace", daemon=True).start()
+        self.saved += 1
+        return path
+
+    def _stage(self, stage, fn, begins_turn=False, ends_turn=False, record_args=None, record_result=None):
+        """Wrap `fn` so each call records start/end events for `stage`"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = self.begin_turn() if begins_turn or self.current is None else self.current
+            trace.event(stage, "start", **(record_args(trace, *args, **kwargs) if record_args else {}))
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                trace.event(stage, "error", error=str(e), duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                raise
+            trace.event(stage, "end", duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                        **(record_result(trace, result, *args, **kwargs) if record_result else {}))
+            if ends_turn:
+                self.end_turn()
+            return result
+        return wrapper
+
+    def wrap_speech_to_text(self, fn):
+        """Trace recorded-audio recognition: input audio in, transcript out"""
+        return self._stage(
+            "stt", fn, begins_turn=True,
+            record_args=lambda trace, audio_data, *a, **k: {"audio": trace.blob("input.audio", audio_data)},
+            record_result=lambda trace, text, *a, **k: {"transcript": text, "end_ms": chosen_end_ms(a, k)}
+        )
+
+    def wrap_microphone(self, fn):
+        """Trace direct microphone recognition (the SDK owns the microphone, so no input audio)"""
+        def record_result(trace, result, *args, **kwargs):
+            # Speculative recognition returns (transcript, prefetched response)
+            if isinstance(result, tuple):
+                return {"transcript": result[0], "speculative_hit": result[1] is not None,
+                        "end_ms": chosen_end_ms(args, kwargs)}
+            return {"transcript": result, "end_ms": chosen_end_ms(args, kwargs)}
+        return self._stage("stt", fn, begins_turn=True, record_result=record_result)
+
+    def wrap_llm(self, fn, system_prompt=""):
+        """Trace GPT requests: prompt in, response, usage and arrival timing out"""
+        def record_args(trace, user_input, *args, **kwargs):
+            return {"system_prompt": system_prompt, "prompt": user_input,
+                    "speculative": threading.current_thread().name.startswith(WORKER_THREAD_PREFIX)}
+
+        def record_result(trace, response, *args, **kwargs):
+            usage = kwargs.get("usage")
+            # Responses are not streamed, so the whole completion arrives as one chunk
+            return {"response": response, "usage": dict(usage) if usage else None,
+                    "chunks": [{"t_ms": trace.now_ms(), "text": response}]}
+        return self._stage("llm", fn, record_args=record_args, record_result=record_result)
+
+    def wrap_text_to_speech(self, fn):
+        """Trace synthesis: text in, audio out; ends the turn"""
+        return self._stage(
+            "tts", fn, ends_turn=True,
+            record_args=lambda trace, text, *a, **k: {"text": text},
+            record_result=lambda trace, audio, *a, **k: {"audio": trace.blob("output.audio", audio)}
+        )
+
+
+def chosen_end_ms(args, kwargs):
+    """End-of-silence timeout the session endpointer picked for a recognition call, if one was passed"""
+    for value in list(args) + list(kwargs.values()):
+        decisions = getattr(value, "decisions", None)
+        if decisions:
+            return decisions[-1]["end_ms"]
+    return None
+
+
+def stage_calls(manifest):
+    """Pair start/end events per stage, in order: [(stage, start_event, end_event)]"""
+    open_calls = {}
+    calls = []
+    for event in manifest["events"]:
+        key = (event["stage"], event["thread"])
+        if event["kind"] == "start":
+            open_calls[key] = event
+        elif key in open_calls:
+            calls.append((event["stage"], open_calls.pop(key), event))
+    return calls
+
+
+class ReplayEngine(SpeechEngine):
+    """Stand-in speech engine that reproduces a traced turn's recognition and synthesis"""
+
+    name = "replay"
+    can_recognize = True
+    can_listen = True
+    can_synthesize = True
+
+    def __init__(self, transcript, stt_ms, stt_end_ms, tts_audio, tts_ms, speed=1.0, stt_engine=None, tts_engine=None):
+        self.transcript = transcript or ""
+        self.stt_ms = stt_ms
+        self.stt_end_ms = stt_end_ms
+        self.tts_audio = tts_audio
+        self.tts_ms = tts_ms
+        self.speed = speed
+        self.stt_engine = stt_engine
+        self.tts_engine = tts_engine
+
+    def _speak(self, timeouts, on_partial):
+        """Emit word-by-word partials over the recorded speaking time, then wait out the end-of-silence timeout"""
+        end_ms = (timeouts or {}).get("end_ms") or 0
+        recorded_end_ms = self.stt_end_ms if self.stt_end_ms is not None else end_ms
+        speaking_s = max(0.0, self.stt_ms - recorded_end_ms) / 1000 / self.speed
+        words = self.transcript.split()
+        for count in range(1, len(words) + 1):
+            time.sleep(speaking_s / len(words))
+            if on_partial:
+                on_partial(" ".join(words[:count]))
+        if not words:
+            time.sleep(speaking_s)
+        time.sleep(end_ms / 1000 / self.speed)
+        if not self.transcript:
+            raise NoSpeechDetected("No speech detected.")
+        return self.transcript
+
+    def transcribe(self, samples, sample_rate=RECOGNIZER_SAMPLE_RATE, timeouts=None, on_partial=None):
+        if self.stt_engine is not None:
+            return self.stt_engine.transcribe(samples, sample_rate, timeouts, on_partial)
+        return self._speak(timeouts, on_partial)
+
+    def listen(self, timeouts=None, on_partial=None):
+        # Traced microphone turns have no input audio, so a local engine cannot stand in here
+        return self._speak(timeouts, on_partial)
+
+    def synthesize(self, text):
+        if self.tts_engine is not None:
+            return self.tts_engine.synthesize(text)
+        time.sleep(self.tts_ms / 1000 / self.speed)
+        return self.tts_audio
+
+
+def answering_llm_call(llm_calls, stt_end):
+    """Recorded GPT call the turn answered with: the matched speculation on a hit, else the last direct request"""
+    if stt_end.get("speculative_hit"):
+        transcript = normalize_transcript(stt_end.get("transcript"))
+        matched = [call for call in llm_calls
+                   if call[0].get("speculative") and normalize_transcript(call[0].get("prompt")) == transcript]
+        if matched:
+            return matched[-1]
+    direct = [call for call in llm_calls if not call[0].get("speculative")]
+    return direct[-1] if direct else None
+
+
+def replay_requests(llm_calls, speed=1.0):
+    """Stand-in for the requests module that answers GPT calls with recorded responses and latencies"""
+    # Direct requests win over speculative ones with the same prompt
+    ordered = sorted(llm_calls, key=lambda call: not call[0].get("speculative"))
+    recorded = {start.get("prompt"): end for start, end in ordered}
+    fallback = llm_calls[-1][1] if llm_calls else {}
+
+    def post(url, **kwargs):
+        end = recorded.get(kwargs["json"]["messages"][-1]["content"], fallback)
+        time.sleep(end.get("duration_ms", 0.0) / 1000 / speed)
+        body = {"choices": [{"message": {"content": end.get("response") or ""}}], "usage": end.get("usage") or {}}
+        return SimpleNamespace(status_code=200, text="", json=lambda: body)
+
+    return SimpleNamespace(post=post, exceptions=SimpleNamespace(Timeout=TimeoutError))
+
+
+@contextlib.contextmanager
+def patched(module, **values):
+    """Temporarily replace module attributes"""
+    saved = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+def replay_trace(path, speed=1.0, stt_engine=None, tts_engine=None, endpointer=None):
+    """Re-drive one traced turn through the app's pipeline functions; returns per-stage timings.
+
+    The app's own recognition, GPT and synthesis functions run again (with its current
+    endpointing, speculative prefetch and FAQ logic); only Azure Speech and the OpenAI
+    endpoint are replaced by stand-ins that return each stage's recorded output after its
+    recorded latency. Stages chain on their inputs: recognition, then the response, then
+    synthesis. A local speech engine can replace the recognition or synthesis stand-in to
+    benchmark it on the same input. Pass the session's `endpointer` when replaying
+    several turns (see replay_traces) so its timeouts adapt as they did live.
+    Run from the app directory so its secrets load.
+    """
+    import streamlit_app as app
+
+    manifest, blobs = load_trace(path)
+    calls = {}
+    for stage, start, end in stage_calls(manifest):
+        calls.setdefault(stage, []).append((start, end))
+    stt_start, stt_end = calls["stt"][0] if "stt" in calls else ({}, {})
+    tts_start, tts_end = calls["tts"][-1] if "tts" in calls else ({}, {})
+    # Calls are paired as they finish; order them by start so "last" means last asked
+    llm_calls = sorted(calls.get("llm", []), key=lambda call: call[0]["t_ms"])
+    answer_call = answering_llm_call(llm_calls, stt_end)
+
+    engine = ReplayEngine(stt_end.get("transcript"), stt_end.get("duration_ms", 0.0), stt_end.get("end_ms"),
+                          blobs.get(tts_end.get("audio")), tts_end.get("duration_ms", 0.0),
+                          speed, stt_engine, tts_engine)
+    openai_config = {"endpoint": "replay://gpt", "api_key": "replay"}
+    if endpointer is None:
+        endpointer = app.AdaptiveEndpointer(app.get_endpointing_config())
+    stats = app.new_speculation_stats()
+    stages = []
+
+    def timed(stage, recorded_ms, fn, *args):
+        started = time.perf_counter()
+        output = fn(*args)
+        stages.append({"stage": stage, "recorded_ms": recorded_ms,
+                       "replayed_ms": round((time.perf_counter() - started) * 1000, 1), "matches": None})
+        return output
+
+    # Undo tracing wrappers so replays are not traced themselves
+    unwrapped = {name: inspect.unwrap(getattr(app, name)) for name in TRACED_STAGES}
+    with patched(app, get_speech_engine=lambda *args, **kwargs: engine,
+                 get_phrase_bank=lambda *args, **kwargs: NO_PHRASES,
+                 load_requests=lambda: replay_requests(llm_calls, speed), **unwrapped):
+        replay_started = time.perf_counter()
+
+        prefetched = None
+        user_text = answer_call[0].get("prompt") if answer_call else ""
+        if stt_start.get("audio") in blobs:
+            user_text = timed("stt", stt_end.get("duration_ms", 0.0), app.speech_to_text,
+                              blobs[stt_start["audio"]], None, endpointer)
+        elif "speculative_hit" in stt_end:
+            user_text, prefetched = timed("stt", stt_end.get("duration_ms", 0.0), app.speculative_microphone_recognition,
+                                          None, openai_config, stats, endpointer)
+        elif stt_end:
+            user_text = timed("stt", stt_end.get("duration_ms", 0.0), app.direct_microphone_recognition,
+                              None, endpointer)
+        if stt_end:
+            stages[-1]["matches"] = user_text == stt_end.get("transcript")
+
+        # Same order as the app: FAQ answer, matched speculation, then a GPT request
+        bot_response = app.lookup_faq(user_text) or prefetched
+        if answer_call:
+            # On a speculative hit the turn did not wait for GPT after recognition
+            recorded_ms = 0.0 if stt_end.get("speculative_hit") else answer_call[1].get("duration_ms", 0.0)
+            ready_response = bot_response
+            bot_response = timed("llm", recorded_ms, lambda: ready_response or app.get_gpt_response(user_text, openai_config))
+            stages[-1]["matches"] = bot_response == answer_call[1].get("response")
+        if tts_end:
+            timed("tts", tts_end.get("duration_ms", 0.0), app.text_to_speech, bot_response or tts_start.get("text", ""), None)
+
+        replayed_total_ms = round((time.perf_counter() - replay_started) * 1000, 1)
+
+    return {
+        "turn_id": manifest["turn_id"],
+        "recorded_total_ms": manifest["events"][-1]["t_ms"] if manifest["events"] else 0.0,
+        "replayed_total_ms": replayed_total_ms,
+        "speculative_hits": stats["hits"],
+        "stages": stages,
+    }
+
+
+def replay_traces(paths, speed=1.0, stt_engine=None, tts_engine=None):
+    """Replay traces in recorded order, sharing one endpointer per session; yields (path, report)"""
+    import streamlit_app as app
+
+    manifests = {path: load_manifest(path) for path in paths}
+    endpointers = {}
+    for path in sorted(paths, key=lambda path: manifests[path]["started_at"]):
+        # Traces recorded before session IDs were traced each replay on their own
+        session_id = manifests[path]["metadata"].get("session_id") or path
+        if session_id not in endpointers:
+            endpointers[session_id] = app.AdaptiveEndpointer(app.get_endpointing_config())
+        yield path, replay_trace(path, speed, stt_engine, tts_engine, endpointers[session_id])
+
+
+def main():
+    """Command line: replay traces and print recorded vs replayed stage timings"""
+    parser = argparse.ArgumentParser(description="Replay recorded voice bot turn traces offline")
+    parser.add_argument("traces", nargs="+", help="Trace files or directories of traces")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (2.0 = twice as fast)")
+    parser.add_argument("--stt-engine", help="Local recognizer to run on recorded input audio (e.g. vosk)")
+    parser.add_argument("--tts-engine", help="Local synthesizer to run on recorded response text (e.g. espeak)")
+    parser.add_argument("--engine-options", default="{}", help="JSON options passed to the local engines")
+    args = parser.parse_args()
+
+    from speech_engines import create_engine
+    options = json.loads(args.engine_options)
+    stt_engine = create_engine(args.stt_engine, options) if args.stt_engine else None
+    tts_engine = create_engine(args.tts_engine, options) if args.tts_engine else None
+
+    paths = []
+    for target in args.traces:
+        target = Path(target)
+        paths.extend(sorted(target.glob("*.zip")) if target.is_dir() else [target])
+    if not paths:
+        print("❌ No traces found")
+        sys.exit(1)
+
+    for path, report in replay_traces(paths, args.speed, stt_engine, tts_engine):
+        print(f"🔁 {path.name}: recorded {report['recorded_total_ms']:.0f} ms, "
+              f"replayed {report['replayed_total_ms']:.0f} ms ({report['speculative_hits']} speculative hits)")
+        for stage in report["stages"]:
+            match = "" if stage["matches"] is None else (" ✅" if stage["matches"] else " ❌ output differs")
+            print(f"   {stage['stage']:<4} {stage['recorded_ms']:>8.0f} ms -> {stage['replayed_ms']:>8.0f} ms{match}")
+
+
+if __name__ == "__main__":
+    main()